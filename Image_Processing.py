@@ -65,6 +65,33 @@ def convert_to_red(image: Image.Image, color: tuple = (255, 0, 0), opacity: floa
     return Image.fromarray(img_array, 'RGBA')
 
 
+def threshold_and_colorize(image: Image.Image, threshold: int = 240, color: tuple = (255, 0, 0)) -> Image.Image:
+    """
+    Remove white background and convert to the specified color in a single pass
+    Same result as remove_white_background followed by convert_to_red, with one buffer scan less
+    
+    Args:
+        image: Input image
+        threshold: Pixels whose RGB channels are all greater than this become transparent
+        color: RGB color tuple, default is (255, 0, 0) = Pure Red
+    """
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    
+    img_array = np.asarray(image)
+    
+    # White pixels become transparent, everything else keeps its alpha
+    white_mask = (img_array[:, :, :3] > threshold).all(axis=2)
+    alpha = np.where(white_mask, 0, img_array[:, :, 3]).astype(np.uint8)
+    
+    # Non-transparent pixels take the color, transparent ones stay black
+    out = np.zeros_like(img_array)
+    out[alpha > 0, :3] = color
+    out[:, :, 3] = alpha
+    
+    return Image.fromarray(out, 'RGBA')
+
+
 def apply_color_effect(base_img: Image.Image, color: tuple) -> Image.Image:
     """
     Simulate layer blending mode 'Color': 
@@ -115,11 +142,8 @@ def process_image_for_papercut(image_path: str) -> str:
         # Step 2: Increase contrast (factor=3.0)
         image = increase_contrast(image, factor=3.0)
         
-        # Step 3: Remove white background (threshold=230)
-        image = remove_white_background(image, threshold=230)
-        
-        # Step 4: Convert to red
-        image = convert_to_red(image)
+        # Step 3 + 4: Remove white background (threshold=230) and convert to red
+        image = threshold_and_colorize(image, threshold=230)
         
         # Determine output path
         base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -141,13 +165,14 @@ def process_image_for_papercut(image_path: str) -> str:
         return None
 
 
-def render_on_window(papercut_input, scene_input, output_path=None) -> Image.Image:
+def render_on_window(papercut_input, scene_input, output_path=None, compress_level=6) -> Image.Image:
     """
     Render to window scene
     Args:
         papercut_input: Papercut image path (str) or PIL.Image object
         scene_input: Scene image path (str) or PIL.Image object
         output_path: (Optional) Output path, save if provided
+        compress_level: (Optional) PNG zlib level used when saving, lower is faster
     Returns:
         PIL.Image: Composited image
     """
@@ -179,7 +204,7 @@ def render_on_window(papercut_input, scene_input, output_path=None) -> Image.Ima
         final_image = scene_rgba.convert('RGB')
         
         if output_path:
-            final_image.save(output_path)
+            final_image.save(output_path, compress_level=compress_level)
             
         return final_image
     except Exception as e:
@@ -187,7 +212,7 @@ def render_on_window(papercut_input, scene_input, output_path=None) -> Image.Ima
         return None
 
 
-def render_on_wall(papercut_input, scene_input, output_path=None) -> Image.Image:
+def render_on_wall(papercut_input, scene_input, output_path=None, compress_level=6) -> Image.Image:
     """
     Render to wall scene
     """
@@ -226,7 +251,7 @@ def render_on_wall(papercut_input, scene_input, output_path=None) -> Image.Image
         final_image = scene_rgba.convert('RGB')
         
         if output_path:
-            final_image.save(output_path)
+            final_image.save(output_path, compress_level=compress_level)
             
         return final_image
     except Exception as e:
@@ -234,7 +259,7 @@ def render_on_wall(papercut_input, scene_input, output_path=None) -> Image.Image
         return None
 
 
-def render_on_door(papercut_input, scene_input, output_path=None) -> Image.Image:
+def render_on_door(papercut_input, scene_input, output_path=None, compress_level=6) -> Image.Image:
     """
     Render to door scene
     """
@@ -273,7 +298,7 @@ def render_on_door(papercut_input, scene_input, output_path=None) -> Image.Image
         final_image = scene_rgba.convert('RGB')
         
         if output_path:
-            final_image.save(output_path)
+            final_image.save(output_path, compress_level=compress_level)
             
         return final_image
     except Exception as e:
@@ -281,7 +306,7 @@ def render_on_door(papercut_input, scene_input, output_path=None) -> Image.Image
         return None
 
 
-def render_on_package(papercut_input, scene_input, output_path=None) -> Image.Image:
+def render_on_package(papercut_input, scene_input, output_path=None, compress_level=6) -> Image.Image:
     """
     Render to package scene
     """
@@ -327,7 +352,7 @@ def render_on_package(papercut_input, scene_input, output_path=None) -> Image.Im
         final_image = scene_rgba.convert('RGB')
         
         if output_path:
-            final_image.save(output_path)
+            final_image.save(output_path, compress_level=compress_level)
             
         return final_image
     except Exception as e:
@@ -2,8 +2,9 @@ import os
 import random
 import asyncio
 import time
+import errno
 import socket
-import requests
+import selectors
 
 # Handle asyncio event loop issue (Streamlit compatibility)
 try:
@@ -11,13 +12,18 @@ try:
 except RuntimeError:
     asyncio.set_event_loop(asyncio.new_event_loop())
 
-from comfy_api_simplified import ComfyApiWrapper, ComfyWorkflowWrapper
+# Last discovered ComfyUI address, reused across runs to skip the port scan
+CACHE_FILE = os.path.expanduser("~/.papercraft_maestro_comfyui")
+CACHE_TTL = 3600  # seconds
+_DISCOVERED_ADDRESS = None
 
 def find_comfyui_address():
     """
     Automatically detect ComfyUI address
     Supports ComfyUI Desktop, command line version, and custom port configuration
     """
+    global _DISCOVERED_ADDRESS
+
     print("Searching for ComfyUI service...")
     
     # 1. Prioritize checking environment variables
@@ -26,7 +32,22 @@ def find_comfyui_address():
         print(f"Found address from environment variable: {env_addr}")
         return env_addr
 
-    # 2. Define list of ports to scan (sorted by priority)
+    # 2. Reuse the address found earlier in this process, then the on-disk cache
+    # Both are re-validated with a quick probe, since ComfyUI may have restarted on another port
+    if _DISCOVERED_ADDRESS:
+        discovered_port = int(_DISCOVERED_ADDRESS.rsplit(":", 1)[1])
+        if _check_comfyui_port(discovered_port, timeout=0.2):
+            return _DISCOVERED_ADDRESS
+        print(f"ComfyUI no longer responding at {_DISCOVERED_ADDRESS}, searching again...")
+        _DISCOVERED_ADDRESS = None
+
+    cached_port = _read_cached_port()
+    if cached_port is not None and _check_comfyui_port(cached_port, timeout=0.2):
+        _DISCOVERED_ADDRESS = f"http://127.0.0.1:{cached_port}"
+        print(f"Found ComfyUI service at cached address: {_DISCOVERED_ADDRESS}")
+        return _DISCOVERED_ADDRESS
+
+    # 3. Define list of ports to scan (sorted by priority)
     # - 8000: ComfyUI Desktop default port
     # - 8188-8199: ComfyUI command line version common port range
     # - 3000, 3001: Ports that might be used by some configurations
@@ -35,47 +56,121 @@ def find_comfyui_address():
     additional_ports = [3000, 3001, 7860, 7861, 8080, 8081, 9000, 9001]
     all_ports = priority_ports + additional_ports
 
-    # 3. Scan ports
-    for port in all_ports:
-        if _check_comfyui_port(port):
-            url = f"http://127.0.0.1:{port}"
-            print(f"Found ComfyUI service at: {url}")
-            return url
-            
+    # 4. Scan all ports at once (total time ~ one timeout)
+    port = _find_comfyui_port(all_ports)
+    if port is not None:
+        _DISCOVERED_ADDRESS = f"http://127.0.0.1:{port}"
+        _write_cached_port(port)
+        print(f"Found ComfyUI service at: {_DISCOVERED_ADDRESS}")
+        return _DISCOVERED_ADDRESS
+
     print("No running ComfyUI found, using default address http://127.0.0.1:8188/")
     print("Tip: Please ensure ComfyUI or ComfyUI Desktop is started")
     return "http://127.0.0.1:8188/"
 
 
-def _check_comfyui_port(port):
+def _read_cached_port():
+    """Return the port stored in CACHE_FILE, or None if missing, stale or invalid"""
+    try:
+        if time.time() - os.path.getmtime(CACHE_FILE) > CACHE_TTL:
+            return None
+        with open(CACHE_FILE, "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cached_port(port):
+    """Atomically store the discovered port in CACHE_FILE"""
+    tmp_path = f"{CACHE_FILE}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(str(port))
+        os.replace(tmp_path, CACHE_FILE)
+    except OSError as e:
+        print(f"Could not cache ComfyUI address: {e}")
+
+
+def _find_comfyui_port(ports, timeout=0.3):
+    """
+    Find the first port (in the given order) where ComfyUI is running
+    
+    All TCP connections are started at once on non-blocking sockets and
+    polled with a single selector, then only the ports that accepted the
+    connection are verified over the already-open socket.
+    
+    Args:
+        ports: Port numbers to check, sorted by priority
+        timeout: TCP connect timeout in seconds (shared by all ports)
+        
+    Returns:
+        int: First port running ComfyUI, or None if not found
+    """
+    selector = selectors.DefaultSelector()
+    socks = {}
+    try:
+        # Start every connection without waiting for it
+        for port in ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            socks[port] = sock
+            sock.setblocking(False)
+            result = sock.connect_ex(('127.0.0.1', port))
+            if result in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                selector.register(sock, selectors.EVENT_WRITE, port)
+
+        # Collect the ports whose connection completed successfully
+        open_ports = set()
+        deadline = time.monotonic() + timeout
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                selector.unregister(key.fileobj)
+                if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    open_ports.add(key.data)
+
+        # Verify candidates in priority order
+        for port in ports:
+            if port in open_ports and _is_comfyui_socket(socks[port]):
+                return port
+        return None
+    finally:
+        selector.close()
+        for sock in socks.values():
+            sock.close()
+
+
+def _is_comfyui_socket(sock):
+    """Check whether a connected socket is served by ComfyUI (check /system_stats endpoint)"""
+    try:
+        # Reuse the open socket for a minimal HEAD request instead of a second connection
+        sock.settimeout(1)
+        sock.sendall(b"HEAD /system_stats HTTP/1.0\r\nHost: 127.0.0.1\r\n\r\n")
+        status_line = sock.recv(32).split(b"\r\n", 1)[0]
+        return b" 200" in status_line
+    except OSError:
+        return False
+
+
+def _check_comfyui_port(port, timeout=0.3):
     """
     Check if ComfyUI service is running on the specified port
     
     Args:
         port: Port number to check
+        timeout: TCP connect timeout in seconds
         
     Returns:
         bool: Returns True if ComfyUI is running on the port
     """
-    try:
-        # Perform quick TCP connection test first
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(0.3)
-        result = sock.connect_ex(('127.0.0.1', port))
-        sock.close()
-        
-        if result != 0:
-            return False
-            
-        # TCP connection successful, verify if it is ComfyUI (check /system_stats endpoint)
-        url = f"http://127.0.0.1:{port}"
-        response = requests.get(f"{url}/system_stats", timeout=1)
-        return response.status_code == 200
-    except:
-        return False
+    return _find_comfyui_port([port], timeout) == port
 
 class ComfyUIManager:
     def __init__(self, workflow_path, server_address=None):
+        # Imported lazily: comfy_api_simplified pulls in requests/websocket-client
+        from comfy_api_simplified import ComfyApiWrapper
+
         if server_address is None:
             self.server_address = find_comfyui_address()
         else:
@@ -96,6 +191,8 @@ class ComfyUIManager:
         Returns:
             str: Full path of the generated image, returns None if failed
         """
+        from comfy_api_simplified import ComfyWorkflowWrapper
+
         try:
             # Reload workflow to ensure a clean state every time
             wf = ComfyWorkflowWrapper(self.workflow_path)
@@ -4,7 +4,8 @@ import time
 import sys
 import base64
 import io
-from PIL import Image, ImageDraw, ImageFont
+import asyncio
+from PIL import Image
 import numpy as np
 
 # Ensure imports work
@@ -12,7 +13,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from comfy_api import ComfyUIManager
-    from Image_Processing import desaturate_image, increase_contrast, remove_white_background, convert_to_red, render_on_window, render_on_wall, render_on_door, render_on_package
+    from Image_Processing import desaturate_image, increase_contrast, threshold_and_colorize, render_on_window, render_on_wall, render_on_door, render_on_package
 except ImportError:
     pass # Will handle gracefully later
 
@@ -22,6 +23,12 @@ WORKFLOW_PATH = os.path.join(BASE_DIR, "comfyui_workflow", "paper_cut.json")
 OUTPUT_DIR = os.path.join(BASE_DIR, "image_raw")
 PROCESSED_DIR = os.path.join(BASE_DIR, "image_processed")
 RENDERED_DIR = os.path.join(BASE_DIR, "image_rendered")
+BG_ASSETS_DIR = os.path.join(BASE_DIR, "ui_assets", "background")
+BG_CACHE_DIR = os.path.join(BASE_DIR, "ui_assets", "cache")
+# Bump BG_CACHE_VERSION whenever the pattern or its encoding changes, so stale cached files are not reused
+BG_CACHE_VERSION = 2
+BG_JPEG_SIZE = 384
+BG_JPEG_QUALITY = 75
 
 # Ensure output directories exist
 for d in [OUTPUT_DIR, PROCESSED_DIR, RENDERED_DIR]:
@@ -43,19 +50,61 @@ def img_to_base64(img):
     img.save(buff, format="PNG")
     return base64.b64encode(buff.getvalue()).decode()
 
-def create_seamless_pattern():
+def img_to_jpeg_bytes(img, size=384, quality=75, background="#F9F7F2"):
+    """Encode an image as a downscaled JPEG (much smaller than PNG for noisy textures)"""
+    # JPEG has no alpha: flatten translucent pixels onto the color they are shown over
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        flat = Image.new('RGB', img.size, background)
+        flat.paste(img, (0, 0), img)
+        img = flat
+    img = img.convert('RGB').resize((size, size), Image.Resampling.BILINEAR)
+    buff = io.BytesIO()
+    img.save(buff, format="JPEG", quality=quality, optimize=False)
+    return buff.getvalue()
+
+def _bg_seed():
+    """Stable seed for the background pattern: changes only when the background assets change"""
+    if os.path.exists(BG_ASSETS_DIR):
+        return int(os.path.getmtime(BG_ASSETS_DIR))
+    return 0
+
+@st.cache_resource(show_spinner=False)
+def _load_bg_thumbnail(path):
+    """Load a background papercut and shrink it to fit a pattern cell (cached by path)"""
+    p_img = Image.open(path).convert('RGBA')
+    # Resize to fit in cell (256x256) with LESS padding
+    # Target size: 230x230 to reduce spacing
+    # BILINEAR is enough here: the pattern is shown faded and blurred behind the content
+    p_img.thumbnail((230, 230), Image.Resampling.BILINEAR)
+    return p_img
+
+@st.cache_resource(show_spinner=False)
+def _load_scene_bg(path):
+    """Decode a scene template once per process (render_on_* convert it to a copy, so sharing is safe)"""
+    return Image.open(path).convert('RGB')
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def create_seamless_pattern(seed=None):
     """Create a distinct tiled background using random papercuts from ui_assets/background with paper texture (3x3 grid)"""
     import random
     import numpy as np
     
+    # Seeded RNGs make the pattern deterministic for a given set of assets
+    if seed is None:
+        seed = _bg_seed()
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    
     # 1. Try to load images from ui_assets/background
-    assets_dir = os.path.join(BASE_DIR, 'ui_assets', 'background')
+    assets_dir = BG_ASSETS_DIR
     
     papercuts = []
     if os.path.exists(assets_dir):
-        for f in os.listdir(assets_dir):
-            if f.endswith('.png') or f.endswith('.jpg'):
-                papercuts.append(os.path.join(assets_dir, f))
+        with os.scandir(assets_dir) as it:
+            papercuts = [e.path for e in it if e.name.endswith(('.png', '.jpg', '.jpeg'))]
+    # Sort so the seeded selection does not depend on directory listing order
+    papercuts.sort()
     
     # 2. Setup Canvas (768x768 for 3x3 grid of 256x256 cells)
     cell_size = 256
@@ -67,29 +116,29 @@ def create_seamless_pattern():
     base_color = [253, 251, 247, 255] 
     img_array = np.full((h, w, 4), base_color, dtype=np.uint8)
     
-    # Add random noise for texture
-    noise = np.random.randint(-5, 5, (h, w, 4), dtype=np.int16)
+    # Add random noise in [-5, 4] for texture
     # Apply noise only to RGB channels, keep Alpha 255
-    img_array[:, :, :3] = np.clip(img_array[:, :, :3] + noise[:, :, :3], 0, 255)
+    # Stay in uint8: shift the base down by 5, then saturating-add noise in [0, 9]
+    rgb = img_array[:, :, :3]
+    rgb -= 5
+    noise = np_rng.integers(0, 10, (h, w, 3), dtype=np.uint8)
+    np.minimum(noise, 255 - rgb, out=noise)
+    rgb += noise
     
-    img = Image.fromarray(img_array.astype(np.uint8), 'RGBA')
+    img = Image.fromarray(img_array, 'RGBA')
     
     # 3. If valid images found, add them to the collage
     if papercuts:
         # Select 9 unique random images (if enough exist)
         if len(papercuts) >= grid_size * grid_size:
-            selected = random.sample(papercuts, k=grid_size * grid_size)
+            selected = rng.sample(papercuts, k=grid_size * grid_size)
         else:
             # Fallback if not enough unique images
-            selected = random.choices(papercuts, k=grid_size * grid_size)
+            selected = rng.choices(papercuts, k=grid_size * grid_size)
         
         for idx, path in enumerate(selected):
             try:
-                p_img = Image.open(path).convert('RGBA')
-                
-                # Resize to fit in cell (256x256) with LESS padding
-                # Target size: 230x230 to reduce spacing
-                p_img.thumbnail((230, 230), Image.Resampling.LANCZOS)
+                p_img = _load_bg_thumbnail(path)
                 
                 # Calculate row and col
                 row = idx // grid_size
@@ -108,11 +157,11 @@ def create_seamless_pattern():
                 py = cell_y + (cell_size - p_img.height) // 2
                 
                 # Adjust opacity (make it subtle background)
-                # Create a new image with adjusted alpha
-                r, g, b, a = p_img.split()
-                # Reduce alpha to 80%
-                a = a.point(lambda x: x * 0.8) 
-                p_img.putalpha(a)
+                # Create a new image with adjusted alpha (np.array copies, so the cached thumbnail is untouched)
+                p_arr = np.array(p_img)
+                # Reduce alpha to 80% (fixed-point: 205 / 256 ~= 0.8)
+                p_arr[:, :, 3] = (p_arr[:, :, 3].astype(np.uint16) * 205 >> 8).astype(np.uint8)
+                p_img = Image.fromarray(p_arr, 'RGBA')
                 
                 # Paste
                 img.paste(p_img, (px, py), p_img)
@@ -126,7 +175,37 @@ def create_seamless_pattern():
     # 3. Fallback
     return img
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def _get_bg_b64(seed):
+    """Return the background pattern as base64 JPEG for the CSS data URI, reusing the on-disk copy for this seed"""
+    # Key covers the assets (seed), the pattern/encode code (version) and the encode settings
+    cache_name = f"bg_v{BG_CACHE_VERSION}_{seed}_{BG_JPEG_SIZE}q{BG_JPEG_QUALITY}.jpg"
+    cache_path = os.path.join(BG_CACHE_DIR, cache_name)
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            data = f.read()
+    else:
+        # Pasted papercuts leave translucent areas; they are flattened onto the page background (.stApp)
+        data = img_to_jpeg_bytes(create_seamless_pattern(seed), size=BG_JPEG_SIZE, quality=BG_JPEG_QUALITY)
+        try:
+            os.makedirs(BG_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+            
+            # Prune patterns cached for older assets or settings
+            with os.scandir(BG_CACHE_DIR) as it:
+                stale = [e.path for e in it if e.name.startswith('bg_') and e.name.endswith('.jpg') and e.name != cache_name]
+            for path in stale:
+                os.remove(path)
+        except OSError as e:
+            print(f"Could not cache background pattern: {e}")
+    return base64.b64encode(data).decode()
+
 def create_placeholder_scene(width=1024, height=1024, type="window"):
+    from PIL import ImageDraw
+
     img = Image.new('RGB', (width, height), color='#F0F0F0')
     draw = ImageDraw.Draw(img)
     
@@ -154,9 +233,8 @@ def create_placeholder_scene(width=1024, height=1024, type="window"):
     return img
 
 # --- CSS Styling ---
-# Generate background pattern
-bg_pattern = create_seamless_pattern()
-bg_b64 = img_to_base64(bg_pattern)
+# Generate background pattern (cached, so reruns skip the image work)
+bg_b64 = _get_bg_b64(_bg_seed())
 
 st.markdown(f"""
 <style>
@@ -182,7 +260,7 @@ st.markdown(f"""
         left: 0;
         width: 200vw;
         height: 200vh;
-        background-image: url("data:image/png;base64,{bg_b64}");
+        background-image: url("data:image/jpeg;base64,{bg_b64}");
         background-repeat: repeat;
         background-size: 768px 768px;
         opacity: 0.8; /* High opacity to ensure visibility */
@@ -276,6 +354,18 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # --- Main App Logic ---
+async def _render_scenes(jobs):
+    """Run (render_fn, papercut, scene, output_path) jobs concurrently in worker threads, results in job order"""
+    # Previews are local files only, so favour encode speed over size
+    return await asyncio.gather(*[
+        asyncio.to_thread(render_fn, papercut, scene, output_path, compress_level=1)
+        for render_fn, papercut, scene, output_path in jobs
+    ])
+
+def _request_generation():
+    """Button callback: runs before the next script run, whichever button instance was clicked"""
+    st.session_state.generate_requested = True
+
 def main():
     # Initialize Session State
     if 'generated_image' not in st.session_state:
@@ -283,6 +373,8 @@ def main():
         st.session_state.generated_image = None
     if 'processed_image' not in st.session_state:
         st.session_state.processed_image = None
+    if 'processed_png_bytes' not in st.session_state:
+        st.session_state.processed_png_bytes = None
     if 'scene_previews' not in st.session_state:
         st.session_state.scene_previews = {}
     
@@ -300,9 +392,11 @@ def main():
     # Use a narrower middle column for better visual centering
     col_btn1, col_btn2, col_btn3 = st.columns([3, 2, 3])
     with col_btn2:
-        # Dynamic button label
+        # Dynamic button label (in a placeholder so it can be relabelled after generation without a rerun)
         btn_label = "Regen" if st.session_state.processed_image else "Generate"
-        generate_btn = st.button(btn_label)
+        btn_placeholder = st.empty()
+        btn_placeholder.button(btn_label, key="generate", on_click=_request_generation)
+    generate_btn = st.session_state.pop("generate_requested", False)
 
     # Create a placeholder for results to allow explicit clearing
     results_placeholder = st.empty()
@@ -313,6 +407,7 @@ def main():
         else:
             # Clear previous results immediately
             st.session_state.processed_image = None
+            st.session_state.processed_png_bytes = None
             st.session_state.generated_image = None
             st.session_state.scene_previews = {}
             results_placeholder.empty() # Explicitly clear the UI
@@ -354,16 +449,22 @@ def main():
                         # Processing steps
                         img = desaturate_image(img)
                         img = increase_contrast(img, factor=3.0)
-                        img = remove_white_background(img, threshold=230)
-                        img = convert_to_red(img)
+                        img = threshold_and_colorize(img, threshold=230)
                         
                         st.session_state.processed_image = img
                         
+                        # Encode PNG once, reused for the saved file and the download button
+                        buf = io.BytesIO()
+                        img.save(buf, format="PNG", compress_level=6)
+                        png_bytes = buf.getvalue()
+                        st.session_state.processed_png_bytes = png_bytes
+                        
                         # Save processed image
                         timestamp = int(time.time())
                         processed_filename = f"processed_{timestamp}.png"
                         processed_path = os.path.join(PROCESSED_DIR, processed_filename)
-                        img.save(processed_path)
+                        with open(processed_path, "wb") as f:
+                            f.write(png_bytes)
                         
                         # Generate Scene Previews
                         status_container.info("Generating scene previews...")
@@ -371,29 +472,29 @@ def main():
                         # Use ui_assets/prototype_images for scene backgrounds
                         ui_assets_dir = os.path.join(BASE_DIR, 'ui_assets', 'prototype_images')
                         
-                        # Window (Base_Window.jpg)
-                        window_bg = os.path.join(ui_assets_dir, 'Base_Window.jpg')
-                        if os.path.exists(window_bg):
-                            output_path = os.path.join(RENDERED_DIR, f"window_{timestamp}.png")
-                            st.session_state.scene_previews['window'] = render_on_window(img, window_bg, output_path)
+                        # Scene name -> (background file, render function)
+                        scene_tasks = [
+                            ('window', 'Base_Window.jpg', render_on_window),
+                            ('package', 'Base_package.jpg', render_on_package),
+                            ('door', 'Base_door.jpg', render_on_door),
+                            ('wall', 'Base_wall.jpeg', render_on_wall),
+                        ]
+                        
+                        render_jobs = {}
+                        for name, bg_file, render_fn in scene_tasks:
+                            scene_bg = os.path.join(ui_assets_dir, bg_file)
+                            if os.path.exists(scene_bg):
+                                output_path = os.path.join(RENDERED_DIR, f"{name}_{timestamp}.png")
+                                render_jobs[name] = (render_fn, img, _load_scene_bg(scene_bg), output_path)
                         
-                        # Package (Base_package.jpg)
-                        package_bg = os.path.join(ui_assets_dir, 'Base_package.jpg')
-                        if os.path.exists(package_bg):
-                            output_path = os.path.join(RENDERED_DIR, f"package_{timestamp}.png")
-                            st.session_state.scene_previews['package'] = render_on_package(img, package_bg, output_path)
-                            
-                        # Door (Base_door.jpg)
-                        door_bg = os.path.join(ui_assets_dir, 'Base_door.jpg')
-                        if os.path.exists(door_bg):
-                            output_path = os.path.join(RENDERED_DIR, f"door_{timestamp}.png")
-                            st.session_state.scene_previews['door'] = render_on_door(img, door_bg, output_path)
-                            
-                        # Wall (Base_wall.jpeg)
-                        wall_bg = os.path.join(ui_assets_dir, 'Base_wall.jpeg')
-                        if os.path.exists(wall_bg):
-                            output_path = os.path.join(RENDERED_DIR, f"wall_{timestamp}.png")
-                            st.session_state.scene_previews['wall'] = render_on_wall(img, wall_bg, output_path)
+                        # Scenes are independent and PIL releases the GIL, so render them in parallel
+                        # Use a private loop: asyncio.run() would unset this thread's loop that comfy_api relies on
+                        loop = asyncio.new_event_loop()
+                        try:
+                            results = loop.run_until_complete(_render_scenes(list(render_jobs.values())))
+                        finally:
+                            loop.close()
+                        st.session_state.scene_previews.update(zip(render_jobs, results))
                         
                         progress_bar.progress(100)
                         status_container.success("Creation complete!")
@@ -401,8 +502,8 @@ def main():
                         status_container.empty()
                         progress_bar.empty()
                         
-                        # Rerun to update button state
-                        st.rerun()
+                        # Update button label in place instead of rerunning the whole script
+                        btn_placeholder.button("Regen", key="regenerate", on_click=_request_generation)
                         
                     else:
                         status_container.error(f"Generation failed: ComfyUI did not return an image")
@@ -424,14 +525,9 @@ def main():
                 # Download button (Centered under image)
                 col_dl1, col_dl2, col_dl3 = st.columns([1, 2, 1])
                 with col_dl2:
-                    import io
-                    buf = io.BytesIO()
-                    st.session_state.processed_image.save(buf, format="PNG")
-                    byte_im = buf.getvalue()
-                    
                     st.download_button(
                         label="Download Papercut",
-                        data=byte_im,
+                        data=st.session_state.processed_png_bytes,
                         file_name=f"papercut_{int(time.time())}.png",
                         mime="image/png"
                     )